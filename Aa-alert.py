@@ -1,45 +1,166 @@
 from datetime import datetime, timedelta, timezone
 from azure.identity import AzureCliCredential
+from azure.mgmt.resource import SubscriptionClient
 from azure.mgmt.resourcegraph import ResourceGraphClient
-from azure.mgmt.resourcegraph.models import QueryRequest
+from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
 from azure.communication.email import EmailClient, EmailContent, EmailMessage, EmailRecipients, EmailAddress
+import json
 import os
 
 # === CONFIGURATION ===
-SUBSCRIPTION_ID = "<your-subscription-id>"
 ACS_CONNECTION_STRING = "<your-acs-connection-string>"
 ALERT_RECIPIENT_EMAIL = "<recipient@example.com>"
 SENDER_EMAIL = "<verified-acs-sender@example.com>"
 
+# Resource types to watch; every type is one alert rule in the digest.
+RESOURCE_TYPES = [
+    "microsoft.automation/automationaccounts",
+]
+
+# Watermark + seen ids are kept here between runs.
+STATE_FILE = os.environ.get("AA_ALERT_STATE_FILE", "aa_alert_state.json")
+
+# First run (no state yet) looks back this far.
+INITIAL_LOOKBACK = timedelta(hours=24)
+
+# Each query re-reads this much before the watermark so resources that reach
+# Resource Graph late are still picked up; the seen-id set drops repeats.
+WATERMARK_OVERLAP = timedelta(hours=1)
+
+PAGE_SIZE = 1000
+SUBSCRIPTION_BATCH = 1000  # Resource Graph accepts at most 1000 subscriptions per request
+
+
+# === Step 0: State ===
+def load_state(path=STATE_FILE, now=None):
+    """Load the high-watermark and seen ids from the previous run."""
+    now = now or datetime.now(timezone.utc)
+    try:
+        with open(path) as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return {"watermark": now - INITIAL_LOOKBACK, "seen": {}}
+
+    return {
+        "watermark": datetime.fromisoformat(raw["watermark"]),
+        "seen": {rid: datetime.fromisoformat(ts) for rid, ts in raw.get("seen", {}).items()},
+    }
+
+def save_state(state, path=STATE_FILE):
+    """Persist state atomically so a crash never leaves a half-written file."""
+    raw = {
+        "watermark": state["watermark"].isoformat(),
+        "seen": {rid: ts.isoformat() for rid, ts in state["seen"].items()},
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(raw, f)
+    os.replace(tmp_path, path)
+
+def advance_state(state, findings, query_time):
+    """Move the watermark to the time this run's query started.
+
+    Quiet runs advance it too, so the queried window never grows. Seen ids
+    are only kept while they can still fall inside the overlap.
+    """
+    seen = dict(state["seen"])
+    for item in findings:
+        seen[item["id"]] = item["creationTime"]
+
+    watermark = max(state["watermark"], query_time)
+    cutoff = watermark - WATERMARK_OVERLAP
+    seen = {rid: ts for rid, ts in seen.items() if ts >= cutoff}
+    return {"watermark": watermark, "seen": seen}
+
+
 # === Step 1: Run Resource Graph Query ===
-def get_recent_automation_accounts():
-    credential = AzureCliCredential()
-    client = ResourceGraphClient(credential)
-    query = """
-    resources
-    | where type == "microsoft.automation/automationaccounts"
-    | extend creationTime = todatetime(properties.creationTime)
-    | where creationTime > ago(24h)
-    | project name, location, resourceGroup, subscriptionId, creationTime
+def get_subscription_ids(credential):
+    """Get all enabled subscriptions the identity has access to."""
+    subs = SubscriptionClient(credential).subscriptions.list()
+    return [sub.subscription_id for sub in subs if sub.state.lower() == "enabled"]
+
+def build_query(resource_types, since):
+    # resourcechanges records a Create for every resource type, unlike
+    # properties.creationTime which only a few types have. It keeps 14 days
+    # of history, so the watcher has to run at least that often.
+    type_list = ", ".join(f'"{t.lower()}"' for t in resource_types)
+    return f"""
+    resourcechanges
+    | extend changeType = tostring(properties.changeType),
+             type = tolower(tostring(properties.targetResourceType)),
+             id = tostring(properties.targetResourceId),
+             creationTime = todatetime(properties.changeAttributes.timestamp)
+    | where changeType == "Create"
+    | where type in~ ({type_list})
+    | where creationTime >= datetime({since.isoformat()})
+    | extend name = extract(@"[^/]+$", 0, id),
+             resourceGroup = tostring(split(id, "/")[4])
+    | project id, name, type, resourceGroup, subscriptionId, creationTime
+    | order by creationTime asc
     """
-    request = QueryRequest(
-        subscriptions=[SUBSCRIPTION_ID],
-        query=query
-    )
-    response = client.resources(request)
-    return response.data
+
+def query_all_pages(client, subscriptions, query):
+    """Yield every row for the query, following skipToken paging."""
+    for i in range(0, len(subscriptions), SUBSCRIPTION_BATCH):
+        skip_token = None
+        while True:
+            request = QueryRequest(
+                subscriptions=subscriptions[i:i + SUBSCRIPTION_BATCH],
+                query=query,
+                options=QueryRequestOptions(
+                    top=PAGE_SIZE,
+                    skip_token=skip_token,
+                    result_format="objectArray",
+                ),
+            )
+            response = client.resources(request)
+            yield from response.data
+            skip_token = response.skip_token
+            if not skip_token:
+                break
+
+def parse_time(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+def get_new_resources(client, subscriptions, resource_types, state):
+    """Return resources created since the watermark that were not reported before."""
+    since = state["watermark"] - WATERMARK_OVERLAP
+    query = build_query(resource_types, since)
+
+    findings = []
+    for row in query_all_pages(client, subscriptions, query):
+        if row["id"] in state["seen"]:
+            continue
+        findings.append({**row, "creationTime": parse_time(row["creationTime"])})
+    return findings
 
 # === Step 2: Send Alert via Email ===
-def send_email_alert(accounts):
-    email_client = EmailClient.from_connection_string(ACS_CONNECTION_STRING)
+def build_digest(findings):
+    """Group findings by resource type into one plain-text digest."""
+    by_type = {}
+    for item in findings:
+        by_type.setdefault(item["type"].lower(), []).append(item)
 
-    account_list = "\n".join(
-        [f"- {acct['name']} (Created: {acct['creationTime']})" for acct in accounts]
-    )
+    sections = []
+    for resource_type in sorted(by_type):
+        items = by_type[resource_type]
+        lines = "\n".join(
+            f"- {item['name']} ({item['resourceGroup']}, {item['subscriptionId']}) "
+            f"Created: {item['creationTime'].isoformat()}"
+            for item in items
+        )
+        sections.append(f"{resource_type} ({len(items)}):\n{lines}")
+    return "\n\n".join(sections)
+
+def send_email_alert(findings, email_client=None):
+    if email_client is None:
+        email_client = EmailClient.from_connection_string(ACS_CONNECTION_STRING)
 
     content = EmailContent(
-        subject="🚨 Azure Automation Account Created in Last 24 Hours",
-        plain_text=f"The following Automation Accounts were created recently:\n\n{account_list}"
+        subject=f"🚨 Azure resource watch: {len(findings)} new resource(s)",
+        plain_text=f"The following resources were created since the last run:\n\n{build_digest(findings)}"
     )
 
     recipients = EmailRecipients(
@@ -57,11 +178,28 @@ def send_email_alert(accounts):
 
     print(f"✔ Alert email sent. Message ID: {result['messageId']}")
 
+# === Step 3: One incremental run ===
+def run_watch(graph_client, subscriptions, resource_types=RESOURCE_TYPES,
+              email_client=None, state_path=STATE_FILE, now=None):
+    """Query the interval since the last run, send one digest, then advance the watermark.
+
+    State is only saved after the email went out, so a failed send is retried
+    on the next run instead of being silently dropped.
+    """
+    now = now or datetime.now(timezone.utc)
+    state = load_state(state_path, now=now)
+    findings = get_new_resources(graph_client, subscriptions, resource_types, state)
+
+    if findings:
+        print(f"🚨 Found {len(findings)} new resource(s) since {state['watermark'].isoformat()}.")
+        send_email_alert(findings, email_client)
+    else:
+        print("✅ No new resources detected.")
+
+    save_state(advance_state(state, findings, now), state_path)
+    return findings
+
 # === MAIN ===
 if __name__ == "__main__":
-    recent_accounts = get_recent_automation_accounts()
-    if recent_accounts and len(recent_accounts) > 0:
-        print(f"🚨 Found {len(recent_accounts)} Automation Account(s) created in last 24 hours.")
-        send_email_alert(recent_accounts)
-    else:
-        print("✅ No recent Automation Account creation detected.")
+    credential = AzureCliCredential()
+    run_watch(ResourceGraphClient(credential), get_subscription_ids(credential))
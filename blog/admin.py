@@ -1,5 +1,70 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+from . import feeds
 from .models import Post
 # Register your models here.
 
-admin.site.register(Post)
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses the planner's row estimate instead of COUNT(*).
+
+    Only kicks in for unfiltered querysets on PostgreSQL and only once the
+    table is big enough for an exact count to hurt; everything else falls
+    back to the normal count.
+    """
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE relname = %s",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= self.estimate_threshold:
+                return int(row[0])
+        return super().count
+
+
+class PostAdmin(admin.ModelAdmin):
+    list_display = ('title', 'author', 'published_date', 'created_date')
+    list_select_related = ('author',)
+    list_filter = ('published_date',)
+    date_hierarchy = 'published_date'
+    search_fields = ('title',)
+    ordering = ('-published_date',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['publish_posts', 'unpublish_posts']
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        url_name = getattr(request.resolver_match, 'url_name', None) or ''
+        if url_name.endswith('_changelist'):
+            # The changelist never shows the post body, so don't load it.
+            queryset = queryset.only(
+                'title', 'published_date', 'created_date', 'author__username',
+            )
+        return queryset
+
+    def publish_posts(self, request, queryset):
+        updated = queryset.update(published_date=timezone.now())
+        transaction.on_commit(feeds.rebuild_feed)
+        self.message_user(request, "%d post(s) published." % updated)
+    publish_posts.short_description = "Publish selected posts"
+
+    def unpublish_posts(self, request, queryset):
+        updated = queryset.update(published_date=None)
+        transaction.on_commit(feeds.rebuild_feed)
+        self.message_user(request, "%d post(s) unpublished." % updated)
+    unpublish_posts.short_description = "Unpublish selected posts"
+
+
+admin.site.register(Post, PostAdmin)
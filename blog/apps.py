@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
 
 
 class BlogConfig(AppConfig):
     name = 'blog'
+
+    def ready(self):
+        from .backends import invalidate_cached_user
+        from .feeds import post_deleted, post_saved
+
+        post_save.connect(invalidate_cached_user, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(invalidate_cached_user, sender=settings.AUTH_USER_MODEL)
+        post_save.connect(post_saved, sender='blog.Post')
+        post_delete.connect(post_deleted, sender='blog.Post')
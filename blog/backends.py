@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+USER_CACHE_ALIAS = getattr(settings, 'USER_CACHE_ALIAS', 'default')
+USER_CACHE_TIMEOUT = getattr(settings, 'USER_CACHE_TIMEOUT', 300)
+USER_CACHE_ALLOW_LOCAL = getattr(settings, 'USER_CACHE_ALLOW_LOCAL', False)
+
+
+def user_cache_key(user_id):
+    return 'blog:user:%s' % user_id
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose per-request user lookup is served from the cache.
+
+    AuthenticationMiddleware calls get_user() on every request; the cached
+    copy is dropped whenever the user is saved or deleted (see
+    invalidate_cached_user), so password changes and deactivation still
+    take effect immediately.
+
+    That only holds if every worker process reads the same cache. With a
+    per-process cache (LocMemCache) the invalidation reaches one process;
+    the others keep the old password hash, and so keep accepting sessions
+    that update_session_auth_hash should have ended, for up to
+    USER_CACHE_TIMEOUT seconds. check_user_cache therefore rejects a
+    local-memory USER_CACHE_ALIAS unless USER_CACHE_ALLOW_LOCAL says the
+    site runs as a single process.
+    """
+
+    def get_user(self, user_id):
+        cache = caches[USER_CACHE_ALIAS]
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, USER_CACHE_TIMEOUT)
+        return user
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    caches[USER_CACHE_ALIAS].delete(user_cache_key(instance.pk))
+
+
+@register()
+def check_user_cache(app_configs, **kwargs):
+    if 'blog.backends.CachedModelBackend' not in settings.AUTHENTICATION_BACKENDS or USER_CACHE_ALLOW_LOCAL:
+        return []
+    if isinstance(caches[USER_CACHE_ALIAS], LocMemCache):
+        return [Error(
+            "CachedModelBackend is using the per-process cache %r." % USER_CACHE_ALIAS,
+            hint="Point USER_CACHE_ALIAS at a cache shared by all workers (memcached, redis), "
+                 "or set USER_CACHE_ALLOW_LOCAL = True if only one process serves the site.",
+            obj='blog.backends.CachedModelBackend',
+            id='blog.E001',
+        )]
+    return []
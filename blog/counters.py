@@ -0,0 +1,168 @@
+"""
+Write-behind view counters and the popular posts ranking.
+
+post_detail only bumps an in-process counter. A background thread, started
+by the first view in each process, writes buffered counts to PostStats in
+one batched upsert every VIEW_COUNT_FLUSH_INTERVAL seconds (sooner once
+VIEW_COUNT_FLUSH_SIZE posts are pending), and whatever is left is written
+on interpreter exit. After each write the top POPULAR_POSTS_COUNT posts are
+stored in the cache for the sidebar; the entry expires after one interval
+so a quiet process still picks up new rankings and unpublished or deleted
+posts. Counts can lag by one interval but are not lost on a clean shutdown.
+"""
+
+import atexit
+import logging
+import math
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 10)
+FLUSH_SIZE = getattr(settings, 'VIEW_COUNT_FLUSH_SIZE', 1000)
+POPULAR_POSTS_COUNT = getattr(settings, 'POPULAR_POSTS_COUNT', 5)
+POPULAR_POSTS_HALF_LIFE = getattr(settings, 'POPULAR_POSTS_HALF_LIFE', 7 * 24 * 3600)
+POPULAR_POSTS_EPOCH = getattr(
+    settings, 'POPULAR_POSTS_EPOCH', datetime(2026, 1, 1, tzinfo=timezone.utc))
+# Weights are 2 ** (half-lives since the start of the current era). Each era
+# lasts ERA_HALF_LIVES half-lives, so a single weight never exceeds 2 ** 64;
+# stored scores from older eras are scaled down when a new era starts.
+ERA_HALF_LIVES = 64
+
+POPULAR_POSTS_CACHE_KEY = 'blog:popular_posts'
+
+_lock = threading.Lock()
+_pending = Counter()
+_wakeup = threading.Event()
+_flusher_pid = None
+
+
+def view_weight(now=None):
+    """Return (era, weight) for a view at ``now``."""
+    half_lives = ((now or timezone.now()) - POPULAR_POSTS_EPOCH).total_seconds() / POPULAR_POSTS_HALF_LIFE
+    era = math.floor(half_lives / ERA_HALF_LIVES)
+    return era, math.pow(2, half_lives - era * ERA_HALF_LIVES)
+
+
+def record_view(post_id):
+    """Count one view; the write happens on the flusher thread, never in the request."""
+    start_flusher()
+    with _lock:
+        _pending[post_id] += 1
+        full = len(_pending) >= FLUSH_SIZE
+    if full:
+        _wakeup.set()
+
+
+def start_flusher():
+    """Start the background flusher once per process (again in a forked child)."""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_forever, name='view-counter-flusher', daemon=True).start()
+
+
+def _flush_forever():
+    while True:
+        _wakeup.wait(FLUSH_INTERVAL)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception:
+            logger.exception("Refreshing the popular posts ranking failed")
+        finally:
+            # This thread's connection is never closed by a request cycle.
+            connections.close_all()
+
+
+def flush():
+    """Write buffered counts to PostStats and refresh the popular posts ranking."""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, Counter()
+    if not pending:
+        return
+
+    try:
+        write_counts(pending)
+    except Exception:
+        logger.exception("Flushing %d view counters failed; keeping them for the next flush", len(pending))
+        with _lock:
+            _pending.update(pending)
+        return
+    refresh_popular_posts()
+
+
+def rescale_scores(era):
+    """Bring scores from earlier eras into ``era``; one UPDATE per stale era, usually none."""
+    from .models import PostStats
+
+    stale = PostStats.objects.filter(score_era__lt=era)
+    for old_era in stale.values_list('score_era', flat=True).distinct().order_by():
+        # ldexp underflows to 0.0 rather than raising for very old eras.
+        factor = math.ldexp(1.0, -(era - old_era) * ERA_HALF_LIVES)
+        PostStats.objects.filter(score_era=old_era).update(score=F('score') * factor, score_era=era)
+
+
+def write_counts(counts, now=None):
+    from .models import Post, PostStats
+
+    era, weight = view_weight(now)
+    with transaction.atomic():
+        rescale_scores(era)
+        # Posts deleted since they were viewed would violate the foreign key.
+        existing = set(Post.objects.filter(pk__in=list(counts)).values_list('pk', flat=True))
+        rows = [(pk, n, n * weight, era) for pk, n in counts.items() if pk in existing]
+
+        if connection.vendor in ('sqlite', 'postgresql'):
+            table = connection.ops.quote_name(PostStats._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    'INSERT INTO {table} (post_id, views, score, score_era) VALUES (%s, %s, %s, %s) '
+                    'ON CONFLICT (post_id) DO UPDATE SET '
+                    'views = {table}.views + excluded.views, '
+                    'score = {table}.score + excluded.score'.format(table=table),
+                    rows,
+                )
+        else:
+            for pk, views, score, era in rows:
+                updated = PostStats.objects.filter(pk=pk).update(
+                    views=F('views') + views, score=F('score') + score)
+                if not updated:
+                    PostStats.objects.create(post_id=pk, views=views, score=score, score_era=era)
+
+
+def refresh_popular_posts():
+    from .models import PostStats
+
+    stats = (PostStats.objects.filter(post__published_date__lte=timezone.now())
+             .select_related('post')
+             .only('views', 'post__title')
+             .order_by('-score')[:POPULAR_POSTS_COUNT])
+    popular = [{'pk': s.post_id, 'title': s.post.title, 'views': s.views} for s in stats]
+    cache.set(POPULAR_POSTS_CACHE_KEY, popular, FLUSH_INTERVAL)
+    return popular
+
+
+def popular_posts():
+    """The precomputed ranking; only queries when the cache is cold (e.g. after a restart)."""
+    popular = cache.get(POPULAR_POSTS_CACHE_KEY)
+    if popular is None:
+        popular = refresh_popular_posts()
+    return popular
+
+
+atexit.register(flush)
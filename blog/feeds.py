@@ -0,0 +1,285 @@
+"""
+Feeds for published posts.
+
+Feeds are served from a stored artifact (a JSON file holding the newest
+published posts) instead of querying and rendering ``Post`` on every poll.
+The artifact is updated from the Post save/delete signals once the
+surrounding transaction commits. Publishing or editing a post needs no
+queries, but rewrites the whole file, full post bodies included, under a
+lock shared by all processes, so the cost grows with FEED_MAX_ENTRIES.
+Serving a feed costs no queries at all.
+
+Only the newest FEED_MAX_ENTRIES posts are in the artifact, so paging
+stops there: older posts are not reachable through any feed page.
+"""
+
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import feedgenerator, timezone
+from django.utils.dateparse import parse_datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FEED_TITLE = 'Blog'
+FEED_MAX_ENTRIES = getattr(settings, 'FEED_MAX_ENTRIES', 1000)
+FEED_PAGE_SIZE = getattr(settings, 'FEED_PAGE_SIZE', 50)
+
+_artifact_cache = {'key': None, 'artifact': None}
+_render_cache = {}
+
+
+def artifact_path():
+    return settings.FEED_ARTIFACT
+
+
+def timestamp(value):
+    """Fixed-width UTC ISO timestamp, so entries can be compared as strings."""
+    return value.astimezone(timezone.utc).isoformat(timespec='microseconds')
+
+
+def entry_for(post):
+    return {
+        'id': post.pk,
+        'title': post.title,
+        'text': post.text,
+        'author': post.author.get_username(),
+        'published': timestamp(post.published_date),
+        'link': reverse('post_detail', kwargs={'pk': post.pk}),
+    }
+
+
+def read_artifact():
+    """Return the stored artifact, re-reading the file only when it changed.
+
+    Returns None when no artifact has been built yet.
+    """
+    path = artifact_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if _artifact_cache['key'] != key:
+        with open(path, encoding='utf-8') as f:
+            _artifact_cache['artifact'] = json.load(f)
+        _artifact_cache['key'] = key
+        _render_cache.clear()
+    return _artifact_cache['artifact']
+
+
+def load_artifact():
+    artifact = read_artifact()
+    if artifact is None:
+        rebuild_feed()
+        artifact = read_artifact()
+    return artifact
+
+
+def write_artifact(entries):
+    entries.sort(key=lambda entry: (entry['published'], entry['id']), reverse=True)
+    del entries[FEED_MAX_ENTRIES:]
+    body = json.dumps(entries, sort_keys=True)
+    artifact = {
+        'version': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+        'updated': timestamp(timezone.now()),
+        'entries': entries,
+    }
+
+    path = artifact_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f)
+    os.replace(tmp_path, path)
+
+
+class artifact_lock:
+    """Serialise read-modify-write cycles on the artifact across processes."""
+
+    def __enter__(self):
+        path = artifact_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path + '.lock', 'w')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def rebuild_feed():
+    """Regenerate the artifact from the database (first run, bulk changes)."""
+    with artifact_lock():
+        _rebuild_locked()
+
+
+def _rebuild_locked():
+    from .models import Post
+
+    posts = (Post.objects.filter(published_date__isnull=False)
+             .select_related('author')
+             .order_by('-published_date', '-pk')[:FEED_MAX_ENTRIES])
+    write_artifact([entry_for(post) for post in posts])
+
+
+def update_feed_entry(post):
+    """Insert, replace or drop a single post's entry."""
+    with artifact_lock():
+        artifact = read_artifact()
+        if artifact is None:
+            return _rebuild_locked()
+
+        entries = artifact['entries']
+        kept = [entry for entry in entries if entry['id'] != post.pk]
+        was_listed = len(kept) != len(entries)
+
+        if post.published_date is None:
+            if not was_listed:
+                return
+            if len(entries) >= FEED_MAX_ENTRIES:
+                # The artifact was full: an older post has to move up into the window.
+                return _rebuild_locked()
+        else:
+            kept.append(entry_for(post))
+        write_artifact(kept)
+
+
+def remove_feed_entry(post_pk):
+    from .models import Post
+
+    update_feed_entry(Post(pk=post_pk, published_date=None))
+
+
+def post_saved(sender, instance, raw=False, **kwargs):
+    # A rolled-back save must not leave its post in the artifact.
+    if not raw:
+        transaction.on_commit(lambda: update_feed_entry(instance))
+
+
+def post_deleted(sender, instance, **kwargs):
+    pk = instance.pk  # cleared on the instance once the delete finishes
+    transaction.on_commit(lambda: remove_feed_entry(pk))
+
+
+def visible_entries(artifact):
+    now = timestamp(timezone.now())
+    return [entry for entry in artifact['entries'] if entry['published'] <= now]
+
+
+def page_count(artifact):
+    return max(1, -(-len(visible_entries(artifact)) // FEED_PAGE_SIZE))
+
+
+class PagedAtom1Feed(feedgenerator.Atom1Feed):
+
+    def add_root_elements(self, handler):
+        super().add_root_elements(handler)
+        for rel in ('next', 'previous'):
+            if self.feed.get(rel):
+                handler.addQuickElement('link', '', {'rel': rel, 'href': self.feed[rel]})
+
+
+class PagedRssFeed(feedgenerator.Rss201rev2Feed):
+
+    def add_root_elements(self, handler):
+        super().add_root_elements(handler)
+        for rel in ('next', 'previous'):
+            if self.feed.get(rel):
+                handler.addQuickElement('atom:link', None, {'rel': rel, 'href': self.feed[rel]})
+
+
+FEED_CLASSES = {'rss': PagedRssFeed, 'atom': PagedAtom1Feed}
+CONTENT_TYPES = {
+    'rss': PagedRssFeed.content_type,
+    'atom': PagedAtom1Feed.content_type,
+    'json': 'application/feed+json; charset=utf-8',
+}
+
+
+def render_feed(fmt, page, build_absolute_uri):
+    """Render one page of a feed; results are cached until the artifact changes."""
+    artifact = load_artifact()
+    entries = visible_entries(artifact)
+    cache_key = (artifact['version'], len(entries), fmt, page, build_absolute_uri('/'))
+    if cache_key in _render_cache:
+        return _render_cache[cache_key]
+
+    items = entries[(page - 1) * FEED_PAGE_SIZE:page * FEED_PAGE_SIZE]
+    feed_url = build_absolute_uri(reverse('post_feed_%s' % fmt))
+    links = {
+        'self': feed_url if page == 1 else '%s?page=%d' % (feed_url, page),
+        'next': '%s?page=%d' % (feed_url, page + 1) if page * FEED_PAGE_SIZE < len(entries) else None,
+        'previous': '%s?page=%d' % (feed_url, page - 1) if page > 1 else None,
+    }
+    home_url = build_absolute_uri(reverse('post_list'))
+
+    if fmt == 'json':
+        feed = {
+            'version': 'https://jsonfeed.org/version/1.1',
+            'title': FEED_TITLE,
+            'home_page_url': home_url,
+            'feed_url': links['self'],
+            'items': [{
+                'id': build_absolute_uri(entry['link']),
+                'url': build_absolute_uri(entry['link']),
+                'title': entry['title'],
+                'content_text': entry['text'],
+                'date_published': entry['published'],
+                'authors': [{'name': entry['author']}],
+            } for entry in items],
+        }
+        if links['next']:
+            feed['next_url'] = links['next']
+        content = json.dumps(feed).encode('utf-8')
+    else:
+        feed = FEED_CLASSES[fmt](
+            title=FEED_TITLE,
+            link=home_url,
+            description='Latest posts',
+            feed_url=links['self'],
+            next=links['next'],
+            previous=links['previous'],
+        )
+        for entry in items:
+            link = build_absolute_uri(entry['link'])
+            feed.add_item(
+                title=entry['title'],
+                link=link,
+                description=entry['text'],
+                author_name=entry['author'],
+                pubdate=parse_datetime(entry['published']),
+                unique_id=link,
+            )
+        content = feed.writeString('utf-8').encode('utf-8')
+
+    _render_cache[cache_key] = content
+    return content
+
+
+def feed_etag(artifact, fmt, page):
+    # Scheduled posts become visible without the artifact changing, so the
+    # number of visible entries is part of the tag.
+    visible = len(visible_entries(artifact))
+    return '"%s-%d-%s-%d"' % (artifact['version'], visible, fmt, page)
+
+
+def feed_last_modified(artifact):
+    # A scheduled post going live changes the feed without rewriting the
+    # artifact, so its publish time counts as a modification too.
+    modified = artifact['updated']
+    visible = visible_entries(artifact)
+    if visible:
+        modified = max(modified, visible[0]['published'])
+    return parse_datetime(modified)
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+BACKENDS = {
+    'model': 'django.contrib.auth.backends.ModelBackend',
+    'cached': 'blog.backends.CachedModelBackend',
+}
+
+
+class Command(BaseCommand):
+    help = "Count the queries an authenticated GET of post_new costs for each session/auth backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help="Requests to measure per combination.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user = User.objects.create_user('bench', password='bench')
+            self.stdout.write("%-16s %-8s %s" % ('session', 'auth', 'queries/request'))
+            for session_name, session_engine in settings.SESSION_ENGINES.items():
+                for backend_name, backend in BACKENDS.items():
+                    per_request = self.measure(user, session_engine, backend, options['requests'])
+                    self.stdout.write("%-16s %-8s %.2f" % (session_name, backend_name, per_request))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def measure(self, user, session_engine, backend, requests):
+        cache.clear()
+        with override_settings(SESSION_ENGINE=session_engine, AUTHENTICATION_BACKENDS=[backend]):
+            client = Client()
+            client.force_login(user, backend=backend)
+            url = reverse('post_new')
+            client.get(url)  # warm caches, as in steady state
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(requests):
+                    client.get(url)
+        return len(queries) / requests
@@ -0,0 +1,63 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+
+FIELDS = ('id', 'author', 'title', 'text', 'created_date', 'published_date')
+
+
+def export_rows(batch_size):
+    """Yield posts as dicts in primary key order without holding them all in memory."""
+    rows = (Post.objects.order_by('pk')
+            .values_list('pk', 'author__username', 'title', 'text', 'created_date', 'published_date')
+            .iterator(chunk_size=batch_size))
+    for pk, author, title, text, created_date, published_date in rows:
+        yield {
+            'id': pk,
+            'author': author,
+            'title': title,
+            'text': text,
+            'created_date': created_date.isoformat(),
+            'published_date': published_date.isoformat() if published_date else '',
+        }
+
+
+class Command(BaseCommand):
+    help = "Stream all posts to a JSONL or CSV file (or stdout)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file, '-' for stdout.")
+        parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows fetched from the database at a time.")
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            out = sys.stdout
+        else:
+            out = open(options['path'], 'w', encoding='utf-8', newline='')
+
+        started = time.perf_counter()
+        count = 0
+        try:
+            rows = export_rows(options['batch_size'])
+            if options['format'] == 'csv':
+                writer = csv.DictWriter(out, fieldnames=FIELDS)
+                writer.writeheader()
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for row in rows:
+                    out.write(json.dumps(row) + '\n')
+                    count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        elapsed = time.perf_counter() - started
+        self.stderr.write("Exported %d posts in %.2fs (%.0f rows/sec)" % (
+            count, elapsed, count / elapsed if elapsed else 0))
@@ -0,0 +1,138 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from blog import feeds
+from blog.models import Post
+
+UPDATE_FIELDS = ('author_id', 'title', 'text', 'created_date', 'published_date')
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_date(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError("invalid datetime %r" % value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream posts from a JSONL or CSV file (as written by export_posts) into the database. "
+        "Rows are upserted by id, so re-running an import is safe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Input file, '-' for stdin.")
+        parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per bulk query and transaction.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        if options['path'] == '-':
+            stream = sys.stdin
+        else:
+            stream = open(options['path'], encoding='utf-8', newline='')
+
+        self.authors = dict(User.objects.values_list('username', 'id'))
+        self.created = self.updated = self.unchanged = 0
+
+        started = time.perf_counter()
+        total = 0
+        try:
+            for batch in batches(read_rows(stream, options['format']), options['batch_size']):
+                self.import_batch(batch, total)
+                total += len(batch)
+                if options['verbosity'] > 1:
+                    self.stderr.write("%d rows..." % total)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if self.created:
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Post]):
+                    cursor.execute(sql)
+        if self.created or self.updated:
+            # bulk_create/bulk_update send no signals, so refresh the feeds in one go.
+            feeds.rebuild_feed()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write("Imported %d rows in %.2fs (%.0f rows/sec): %d created, %d updated, %d unchanged" % (
+            total, elapsed, total / elapsed if elapsed else 0, self.created, self.updated, self.unchanged))
+
+    def build_post(self, row, line):
+        try:
+            post = Post(
+                pk=int(row['id']),
+                author_id=self.authors.get(row['author']),
+                title=row['title'],
+                text=row['text'],
+                created_date=parse_date(row['created_date']),
+                published_date=parse_date(row.get('published_date')),
+            )
+        except KeyError as e:
+            raise CommandError("Row %d: missing field %s" % (line, e))
+        except (TypeError, ValueError) as e:
+            raise CommandError("Row %d: %s" % (line, e))
+
+        if post.author_id is None:
+            raise CommandError("Row %d: unknown author %r" % (line, row['author']))
+        if post.created_date is None:
+            raise CommandError("Row %d: created_date is required" % line)
+        return post
+
+    def import_batch(self, batch, offset):
+        posts = [self.build_post(row, offset + i + 1) for i, row in enumerate(batch)]
+        posts = list({post.pk: post for post in posts}.values())  # last row for an id wins
+
+        with transaction.atomic():
+            existing = {
+                values[0]: values[1:]
+                for values in Post.objects.filter(pk__in=[post.pk for post in posts])
+                                          .values_list('pk', *UPDATE_FIELDS)
+            }
+            to_create = [post for post in posts if post.pk not in existing]
+            to_update = [
+                post for post in posts
+                if post.pk in existing
+                and existing[post.pk] != tuple(getattr(post, field) for field in UPDATE_FIELDS)
+            ]
+            Post.objects.bulk_create(to_create)
+            if to_update:
+                Post.objects.bulk_update(to_update, UPDATE_FIELDS)
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        self.unchanged += len(posts) - len(to_create) - len(to_update)
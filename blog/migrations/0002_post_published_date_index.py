@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='published_date',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
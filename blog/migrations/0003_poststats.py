@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-19 20:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_post_published_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostStats',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='blog.Post')),
+                ('views', models.BigIntegerField(default=0)),
+                ('score', models.FloatField(db_index=True, default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_poststats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poststats',
+            name='score_era',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+    ]
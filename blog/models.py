@@ -8,7 +8,7 @@ class Post(models.Model):
     title = models.CharField(max_length=200)
     text = models.TextField()
     created_date = models.DateTimeField(default=timezone.now)
-    published_date = models.DateTimeField(blank=True, null=True)
+    published_date = models.DateTimeField(blank=True, null=True, db_index=True)
 
     def publish(self):
         self.published_date = timezone.now()
@@ -16,3 +16,18 @@ class Post(models.Model):
 
     def __str__(self):
         return self.title
+
+
+class PostStats(models.Model):
+    """View counters for a post, written in batches by blog.counters."""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    views = models.BigIntegerField(default=0)
+    # Forward-decayed popularity: each view adds a weight that grows over
+    # time, which is the same ranking as decaying every older view. The
+    # weight is relative to the start of score_era; scores are rescaled when
+    # a new era begins so they never overflow.
+    score = models.FloatField(default=0, db_index=True)
+    score_era = models.IntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return '%s: %d views' % (self.post_id, self.views)
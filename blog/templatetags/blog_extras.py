@@ -0,0 +1,29 @@
+from functools import lru_cache
+
+from django import template
+from django.contrib.staticfiles import finders
+from django.utils.safestring import mark_safe
+
+from .. import counters
+
+register = template.Library()
+
+
+@lru_cache(maxsize=None)
+def read_static(path):
+    found = finders.find(path)
+    if not found:
+        return ''
+    with open(found, encoding='utf-8') as f:
+        return f.read()
+
+
+@register.simple_tag
+def inline_static(path):
+    """Inline a static file's contents, e.g. critical CSS inside a <style> block."""
+    return mark_safe(read_static(path))
+
+
+@register.inclusion_tag('blog/popular_posts.html')
+def popular_posts():
+    return {'popular_posts': counters.popular_posts()}
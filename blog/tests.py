@@ -1,3 +1,466 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+
+from forum import profiling
+
+from . import counters, feeds
+from .backends import CachedModelBackend, check_user_cache
+from .models import Post, PostStats
 
 # Create your tests here.
+
+
+class TempFeedArtifactMixin:
+    """Keep the feed artifact in a temporary directory instead of feeds/ in the repo."""
+
+    def setUp(self):
+        super().setUp()
+        feed_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, feed_dir)
+        override = override_settings(FEED_ARTIFACT=os.path.join(feed_dir, 'posts.json'))
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class PostAdminTests(TempFeedArtifactMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        authors = [User.objects.create_user('author%d' % i) for i in range(3)]
+        Post.objects.bulk_create(
+            Post(author=authors[i % 3], title='Post %d' % i, text='body') for i in range(20)
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+        self.changelist_url = reverse('admin:blog_post_changelist')
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        # session, user, count, page of posts joined with their authors,
+        # and two date hierarchy queries
+        with self.assertNumQueries(6):
+            response = self.client.get(self.changelist_url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_changelist_defers_post_text(self):
+        response = self.client.get(self.changelist_url)
+        post = response.context['cl'].result_list[0]
+        self.assertIn('text', post.get_deferred_fields())
+
+    def test_publish_and_unpublish_actions_update_in_bulk(self):
+        pks = list(Post.objects.values_list('pk', flat=True))
+        data = {'action': 'publish_posts', '_selected_action': pks}
+        # session, user, count and the UPDATE; the feed is rebuilt on commit
+        with self.assertNumQueries(4):
+            self.client.post(self.changelist_url, data)
+        self.assertFalse(Post.objects.filter(published_date__isnull=True).exists())
+
+        data['action'] = 'unpublish_posts'
+        self.client.post(self.changelist_url, data)
+        self.assertFalse(Post.objects.filter(published_date__isnull=False).exists())
+
+
+class CachedUserTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='password')
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_authenticated_request_needs_no_session_or_auth_queries(self):
+        self.client.force_login(self.user, backend='blog.backends.CachedModelBackend')
+        self.client.get(reverse('post_new'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('post_new'))
+        self.assertTrue(response.context['user'].is_authenticated)
+
+    def test_saving_user_invalidates_cached_copy(self):
+        backend = CachedModelBackend()
+        backend.get_user(self.user.pk)
+        self.user.first_name = 'Alice'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(backend.get_user(self.user.pk).first_name, 'Alice')
+        with self.assertNumQueries(0):
+            backend.get_user(self.user.pk)
+
+    def test_local_memory_user_cache_is_rejected_unless_allowed(self):
+        with mock.patch('blog.backends.USER_CACHE_ALLOW_LOCAL', False):
+            self.assertEqual([e.id for e in check_user_cache(None)], ['blog.E001'])
+        with mock.patch('blog.backends.USER_CACHE_ALLOW_LOCAL', True):
+            self.assertEqual(check_user_cache(None), [])
+
+
+class StaticPipelineTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.static_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(STATIC_ROOT=cls.static_root)
+        cls.settings_override.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings_override.disable()
+        shutil.rmtree(cls.static_root)
+
+    def test_base_template_uses_fingerprinted_local_assets(self):
+        response = self.client.get(reverse('post_list'))
+        self.assertNotContains(response, 'bootstrapcdn')
+        self.assertNotContains(response, 'fonts.g')
+        self.assertContains(response, staticfiles_storage.url('css/blog.css'))
+        self.assertRegex(staticfiles_storage.url('css/blog.css'), r'/static/css/blog\.[0-9a-f]{12}\.css$')
+
+    def test_fingerprinted_file_is_served_precompressed_and_immutable(self):
+        url = staticfiles_storage.url('css/blog.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn(b'.page-header', gzip.decompress(b''.join(response.streaming_content)))
+
+    def test_refused_encoding_is_not_served(self):
+        url = staticfiles_storage.url('css/blog.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, deflate')
+        self.assertNotIn('Content-Encoding', response)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, *;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_unhashed_file_is_served_with_short_cache(self):
+        response = self.client.get('/static/css/blog.css')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+
+
+class FeedTests(TempFeedArtifactMixin, TransactionTestCase):
+    # The artifact is updated on commit, so these tests need real commits.
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer')
+
+    def create_post(self, title, publish=True):
+        post = Post.objects.create(author=self.author, title=title, text='Text of %s' % title)
+        if publish:
+            post.publish()
+        return post
+
+    def test_publish_updates_artifact_and_feeds_need_no_queries(self):
+        self.create_post('First')
+        self.create_post('Draft', publish=False)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('post_feed_json'))
+        titles = [item['title'] for item in json.loads(response.content.decode())['items']]
+        self.assertEqual(titles, ['First'])
+
+        self.create_post('Second')
+        for name in ('post_feed_rss', 'post_feed_atom'):
+            response = self.client.get(reverse(name))
+            self.assertContains(response, 'Second')
+            self.assertContains(response, 'First')
+
+    def test_edit_moves_post_to_top(self):
+        first = self.create_post('First')
+        self.create_post('Second')
+        self.client.force_login(self.author)
+        self.client.post(reverse('post_edit', kwargs={'pk': first.pk}), {'title': 'First edited', 'text': 'x'})
+        entries = feeds.load_artifact()['entries']
+        self.assertEqual([entry['title'] for entry in entries], ['First edited', 'Second'])
+
+    def test_conditional_get_returns_not_modified(self):
+        self.create_post('First')
+        response = self.client.get(reverse('post_feed_atom'))
+        response = self.client.get(reverse('post_feed_atom'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.create_post('Second')
+        response = self.client.get(reverse('post_feed_atom'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_rolled_back_save_does_not_reach_the_feed(self):
+        self.create_post('Kept')
+        try:
+            with transaction.atomic():
+                self.create_post('Rolled back')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual([entry['title'] for entry in feeds.load_artifact()['entries']], ['Kept'])
+
+    def test_last_modified_moves_when_scheduled_post_goes_live(self):
+        self.create_post('Now')
+        future = Post.objects.create(author=self.author, title='Later', text='x')
+        future.published_date = timezone.now() + timezone.timedelta(hours=1)
+        future.save()
+        response = self.client.get(reverse('post_feed_atom'))
+        self.assertNotContains(response, 'Later')
+
+        with mock.patch('django.utils.timezone.now', return_value=future.published_date + timezone.timedelta(minutes=1)):
+            response = self.client.get(reverse('post_feed_atom'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Later')
+
+    def test_pagination(self):
+        for i in range(3):
+            self.create_post('Post %d' % i)
+        page_size = feeds.FEED_PAGE_SIZE
+        feeds.FEED_PAGE_SIZE = 2
+        self.addCleanup(setattr, feeds, 'FEED_PAGE_SIZE', page_size)
+
+        first = json.loads(self.client.get(reverse('post_feed_json')).content.decode())
+        self.assertEqual(len(first['items']), 2)
+        second = json.loads(self.client.get(first['next_url']).content.decode())
+        self.assertEqual([item['title'] for item in second['items']], ['Post 0'])
+        self.assertNotIn('next_url', second)
+        self.assertEqual(self.client.get(reverse('post_feed_json'), {'page': 3}).status_code, 404)
+
+
+class ImportExportTests(TempFeedArtifactMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        self.author = User.objects.create_user('writer')
+
+    def run_import(self, path, *args):
+        out = io.StringIO()
+        call_command('import_posts', path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_round_trip_is_idempotent(self):
+        for fmt in ('jsonl', 'csv'):
+            with self.subTest(fmt=fmt):
+                Post.objects.all().delete()
+                post = Post.objects.create(author=self.author, title='Hello, "world"', text='line 1\nline 2')
+                post.publish()
+                Post.objects.create(author=self.author, title='Draft', text='...')
+                path = os.path.join(self.work_dir, 'posts.' + fmt)
+                call_command('export_posts', path, '--format', fmt, stderr=io.StringIO())
+                exported = list(Post.objects.order_by('pk').values())
+
+                Post.objects.all().delete()
+                output = self.run_import(path, '--format', fmt, '--batch-size', '1')
+                self.assertIn('2 created, 0 updated, 0 unchanged', output)
+                self.assertEqual(list(Post.objects.order_by('pk').values()), exported)
+
+                output = self.run_import(path, '--format', fmt)
+                self.assertIn('0 created, 0 updated, 2 unchanged', output)
+                self.assertEqual(Post.objects.count(), 2)
+
+    def test_import_updates_changed_rows_and_rebuilds_feed(self):
+        post = Post.objects.create(author=self.author, title='Old', text='x')
+        path = os.path.join(self.work_dir, 'posts.jsonl')
+        with open(path, 'w') as f:
+            f.write(json.dumps({
+                'id': post.pk, 'author': 'writer', 'title': 'New', 'text': 'x',
+                'created_date': post.created_date.isoformat(), 'published_date': '2020-01-01T00:00:00+00:00',
+            }) + '\n')
+        self.assertIn('0 created, 1 updated', self.run_import(path))
+        self.assertEqual(Post.objects.get(pk=post.pk).title, 'New')
+        self.assertEqual([entry['title'] for entry in feeds.load_artifact()['entries']], ['New'])
+
+    def test_invalid_rows_are_reported(self):
+        row = {'id': 1, 'author': 'writer', 'text': 't', 'created_date': '2020-01-01T00:00:00'}
+        path = os.path.join(self.work_dir, 'posts.jsonl')
+        for fields, message in (({'title': 't', 'author': 'nobody'}, "Row 1: unknown author 'nobody'"),
+                                ({'title': 't', 'created_date': ''}, 'Row 1: created_date is required'),
+                                ({}, "Row 1: missing field 'title'")):
+            with self.subTest(message=message):
+                with open(path, 'w') as f:
+                    f.write(json.dumps(dict(row, **fields)))
+                with self.assertRaisesMessage(CommandError, message):
+                    self.run_import(path)
+
+    def test_batch_size_must_be_positive(self):
+        for size in ('0', '-1'):
+            with self.assertRaisesMessage(CommandError, '--batch-size must be at least 1'):
+                self.run_import(os.path.join(self.work_dir, 'missing.jsonl'), '--batch-size', size)
+
+
+class ViewCounterTests(TempFeedArtifactMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(counters.flush)
+        cache.clear()
+        # The flusher thread would write on its own connection, outside the test transaction.
+        self.real_start_flusher = counters.start_flusher
+        patcher = mock.patch.object(counters, 'start_flusher')
+        self.start_flusher = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        author = User.objects.create_user('writer')
+        self.posts = [Post.objects.create(author=author, title='Post %d' % i, text='x') for i in range(3)]
+        for post in self.posts:
+            post.publish()
+
+    def test_views_are_buffered_until_flush(self):
+        for _ in range(3):
+            self.client.get(reverse('post_detail', kwargs={'pk': self.posts[1].pk}))
+        self.client.get(reverse('post_detail', kwargs={'pk': self.posts[2].pk}))
+        self.assertFalse(PostStats.objects.exists())
+
+        with self.assertNumQueries(6):  # savepoint, stale eras, existing posts, upsert, release, ranking
+            counters.flush()
+        self.assertEqual(PostStats.objects.get(pk=self.posts[1].pk).views, 3)
+
+        counters.record_view(self.posts[1].pk)
+        counters.flush()
+        self.assertEqual(PostStats.objects.get(pk=self.posts[1].pk).views, 4)
+
+    def test_requests_never_write_and_a_full_buffer_wakes_the_flusher(self):
+        counters._wakeup.clear()
+        with mock.patch.object(counters, 'FLUSH_SIZE', 2), self.assertNumQueries(0):
+            counters.record_view(self.posts[0].pk)
+            self.assertFalse(counters._wakeup.is_set())
+            counters.record_view(self.posts[1].pk)
+        self.assertTrue(counters._wakeup.is_set())
+        self.assertTrue(self.start_flusher.called)
+
+    def test_flusher_is_started_once_per_process(self):
+        with mock.patch.object(counters, '_flusher_pid', None), \
+                mock.patch.object(counters.threading, 'Thread') as thread:
+            self.real_start_flusher()
+            self.real_start_flusher()
+            self.assertEqual(thread.call_count, 1)
+            with mock.patch('os.getpid', return_value=-1):  # a forked child
+                self.real_start_flusher()
+            self.assertEqual(thread.call_count, 2)
+
+    def test_flusher_runs_without_traffic(self):
+        flushed = threading.Event()
+
+        def flush():
+            flushed.set()
+            raise SystemExit  # ends the thread
+
+        with mock.patch.object(counters, 'FLUSH_INTERVAL', 0.01), \
+                mock.patch.object(counters, 'flush', side_effect=flush):
+            thread = threading.Thread(target=counters._flush_forever, daemon=True)
+            thread.start()
+            self.assertTrue(flushed.wait(5))
+            thread.join(5)
+
+    def test_ranking_expires_after_one_interval(self):
+        counters.record_view(self.posts[0].pk)
+        with mock.patch.object(counters, 'FLUSH_INTERVAL', 0.05):
+            counters.flush()
+            self.posts[0].published_date = None
+            self.posts[0].save()
+            self.assertEqual(len(counters.popular_posts()), 1)
+            time.sleep(0.1)
+            self.assertEqual(counters.popular_posts(), [])
+
+    def test_sidebar_is_rendered_from_the_precomputed_ranking(self):
+        for post, views in zip(self.posts, (1, 5, 3)):
+            for _ in range(views):
+                counters.record_view(post.pk)
+        counters.flush()
+        self.assertEqual([p['title'] for p in counters.popular_posts()], ['Post 1', 'Post 2', 'Post 0'])
+
+        with self.assertNumQueries(1):  # the post list itself
+            response = self.client.get(reverse('post_list'))
+        self.assertContains(response, '5 views')
+
+    def test_recent_views_outrank_older_ones(self):
+        week = counters.POPULAR_POSTS_HALF_LIFE
+        counters.write_counts({self.posts[0].pk: 10})
+        later = timezone.now() + timezone.timedelta(seconds=2 * week)
+        counters.write_counts({self.posts[1].pk: 3}, later)
+        self.assertEqual(counters.refresh_popular_posts()[0]['pk'], self.posts[1].pk)
+
+    @mock.patch.object(counters, 'POPULAR_POSTS_HALF_LIFE', 60)
+    def test_scores_are_rescaled_instead_of_overflowing(self):
+        start = counters.POPULAR_POSTS_EPOCH
+        minute = timezone.timedelta(seconds=60)
+        counters.write_counts({self.posts[0].pk: 10}, start + 30 * minute)
+        counters.write_counts({self.posts[1].pk: 3}, start + 70 * minute)  # next era
+
+        old, new = (PostStats.objects.get(pk=post.pk) for post in self.posts[:2])
+        self.assertEqual((old.score_era, new.score_era), (1, 1))
+        self.assertEqual(old.score / new.score, (10 * 2 ** 30) / (3 * 2 ** 70))
+
+        # A year of one-minute half-lives would be 2 ** 525600 without eras.
+        counters.write_counts({self.posts[2].pk: 1}, start + timezone.timedelta(days=365))
+        self.assertEqual(set(PostStats.objects.values_list('score_era', flat=True)), {8212})
+        self.assertEqual(counters.refresh_popular_posts()[0]['pk'], self.posts[2].pk)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1, PROFILING_SLOW_MS=0, PROFILING_MAX_FILES=2)
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        override = override_settings(PROFILING_DIR=self.profile_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+
+    def test_server_timing_header_and_rotating_profile_store(self):
+        for _ in range(3):
+            response = self.client.get(reverse('post_list'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'view;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+        self.assertEqual(len(os.listdir(self.profile_dir)), 2)
+
+    def test_queries_run_while_rendering_count_as_db_time_only(self):
+        author = User.objects.create_user('writer')
+        Post.objects.create(author=author, title='Post', text='x').publish()
+        record_query = profiling.RequestProfile.record_query
+
+        def slow_query(profile, execute, *args):
+            def slow_execute(*args):
+                time.sleep(0.05)
+                return execute(*args)
+            return record_query(profile, slow_execute, *args)
+
+        # post_list's queryset is only evaluated by the template.
+        with mock.patch.object(profiling.RequestProfile, 'record_query', slow_query):
+            response = self.client.get(reverse('post_list'))
+        timing = {part.split(';')[0].strip(): float(part.split('dur=')[1].split(';')[0])
+                  for part in response['Server-Timing'].split(',') if 'dur=' in part}
+        self.assertGreaterEqual(timing['db'], 50)
+        self.assertLess(timing['tpl'], 50)
+        self.assertAlmostEqual(timing['db'] + timing['tpl'] + timing['view'], timing['total'], delta=0.5)
+
+    def test_duplicated_queries_are_flagged(self):
+        author = User.objects.create_user('writer')
+        profile = profiling.RequestProfile()
+        with connection.execute_wrapper(profile.record_query):
+            for _ in range(3):
+                list(Post.objects.filter(author=author))
+        [(sql, count)] = profile.duplicates()
+        self.assertIn('blog_post', sql)
+        self.assertEqual(count, 3)
+
+    def test_summary_is_staff_only(self):
+        self.client.get(reverse('post_list'))
+        self.assertEqual(self.client.get(reverse('profiling_summary')).status_code, 302)
+
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('profiling_summary'))
+        self.assertContains(response, 'post_list')
@@ -6,5 +6,8 @@ urlpatterns = [
     url(r'^post/(?P<pk>\d+)/$', views.post_detail, name='post_detail'),
     url(r'^post/new/$', views.post_new, name='post_new'),
     url(r'^post/(?P<pk>\d+)/edit/$', views.post_edit, name='post_edit'),
+    url(r'^feed/rss/$', views.post_feed, {'fmt': 'rss'}, name='post_feed_rss'),
+    url(r'^feed/atom/$', views.post_feed, {'fmt': 'atom'}, name='post_feed_atom'),
+    url(r'^feed/json/$', views.post_feed, {'fmt': 'json'}, name='post_feed_json'),
 
 ]
@@ -4,6 +4,10 @@ from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from .forms import PostForm
 from django.shortcuts import redirect
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from . import counters, feeds
 
 
 # Create your views here.
@@ -13,6 +17,7 @@ def post_list(request):
 
 def post_detail(request, pk):
     post = get_object_or_404(Post, pk=pk)
+    counters.record_view(post.pk)
     return render(request, 'blog/post_detail.html', {'post':post})
 
 def post_new(request):
@@ -42,3 +47,23 @@ def post_edit(request, pk):
         form = PostForm(instance=post)
     return render(request, 'blog/post_edit.html', {'form': form})
 
+def post_feed(request, fmt):
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        raise Http404("Invalid page")
+
+    artifact = feeds.load_artifact()
+    if not 1 <= page <= feeds.page_count(artifact):
+        raise Http404("No such page")
+
+    etag = feeds.feed_etag(artifact, fmt, page)
+    last_modified = int(feeds.feed_last_modified(artifact).timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content = feeds.render_feed(fmt, page, request.build_absolute_uri)
+        response = HttpResponse(content, content_type=feeds.CONTENT_TYPES[fmt])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'public, max-age=300'
+    return response
@@ -0,0 +1,185 @@
+"""
+Opt-in request instrumentation for the forum project.
+
+When PROFILING_ENABLED is set, ``ProfilingMiddleware`` times every request
+(view, template rendering and database), counts queries, flags SQL that
+runs several times in one request (a likely N+1) and reports the numbers in
+a ``Server-Timing`` header. A PROFILING_SAMPLE_RATE fraction of requests
+runs under cProfile; captures of those that turn out slower than
+PROFILING_SLOW_MS are kept in PROFILING_DIR, newest PROFILING_MAX_FILES
+only. ``summary`` is a staff-only page listing the slowest URL patterns.
+
+Aggregates are kept per process.
+"""
+
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.shortcuts import render
+from django.template import base as template_base
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.db_count = 0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.db_count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        threshold = settings.PROFILING_DUPLICATE_THRESHOLD
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+def _timed_render(render):
+    def wrapper(self, context):
+        profile = getattr(_local, 'profile', None)
+        if profile is None:
+            return render(self, context)
+        # {% include %} and inclusion tags render nested templates; only time the outermost.
+        profile.template_depth += 1
+        start, db_start = time.perf_counter(), profile.db_time
+        try:
+            return render(self, context)
+        finally:
+            profile.template_depth -= 1
+            if profile.template_depth == 0:
+                # Lazy querysets evaluated while rendering are already in
+                # db_time; leave them out so db, tpl and view don't overlap.
+                elapsed = time.perf_counter() - start
+                profile.template_time += elapsed - (profile.db_time - db_start)
+    wrapper.profiled = True
+    return wrapper
+
+
+def url_pattern(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match.route
+
+
+def record(pattern, total, profile, duplicates):
+    with _stats_lock:
+        stats = _stats.setdefault(pattern, {
+            'pattern': pattern, 'count': 0, 'total': 0.0, 'max': 0.0,
+            'db_count': 0, 'db_time': 0.0, 'template_time': 0.0, 'duplicate_requests': 0,
+        })
+        stats['count'] += 1
+        stats['total'] += total
+        stats['max'] = max(stats['max'], total)
+        stats['db_count'] += profile.db_count
+        stats['db_time'] += profile.db_time
+        stats['template_time'] += profile.template_time
+        if duplicates:
+            stats['duplicate_requests'] += 1
+            stats['worst_duplicate'] = duplicates[0]
+
+
+def save_profile(profiler, pattern, total):
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = '%d-%s-%dms.prof' % (time.time() * 1000, pattern.replace(':', '_').replace('/', '_'), total * 1000)
+    profiler.dump_stats(os.path.join(directory, name))
+
+    captures = sorted(f for f in os.listdir(directory) if f.endswith('.prof'))
+    for old in captures[:-settings.PROFILING_MAX_FILES]:
+        os.remove(os.path.join(directory, old))
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if not getattr(template_base.Template.render, 'profiled', False):
+            template_base.Template.render = _timed_render(template_base.Template.render)
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        profiler = cProfile.Profile() if random.random() < settings.PROFILING_SAMPLE_RATE else None
+
+        _local.profile = profile
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile.record_query):
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _local.profile = None
+        total = time.perf_counter() - start
+
+        pattern = url_pattern(request)
+        duplicates = profile.duplicates()
+        if duplicates:
+            sql, n = duplicates[0]
+            logger.warning("%s ran the same query %d times (possible N+1): %s", pattern, n, sql)
+
+        view_time = max(total - profile.db_time - profile.template_time, 0)
+        timings = [
+            'db;dur=%.1f;desc="%d queries"' % (profile.db_time * 1000, profile.db_count),
+            'tpl;dur=%.1f' % (profile.template_time * 1000),
+            'view;dur=%.1f' % (view_time * 1000),
+            'total;dur=%.1f' % (total * 1000),
+        ]
+        if duplicates:
+            timings.append('dup;desc="%d duplicated queries"' % len(duplicates))
+        response['Server-Timing'] = ', '.join(timings)
+
+        record(pattern, total, profile, duplicates)
+        if profiler is not None and total * 1000 >= settings.PROFILING_SLOW_MS:
+            save_profile(profiler, pattern, total)
+        return response
+
+
+@staff_member_required
+def summary(request):
+    with _stats_lock:
+        rows = [dict(stats) for stats in _stats.values()]
+    for row in rows:
+        row['avg_ms'] = row['total'] / row['count'] * 1000
+        row['max_ms'] = row['max'] * 1000
+        row['avg_queries'] = row['db_count'] / row['count']
+        row['avg_db_ms'] = row['db_time'] / row['count'] * 1000
+        row['avg_template_ms'] = row['template_time'] / row['count'] * 1000
+    rows.sort(key=lambda row: row['avg_ms'], reverse=True)
+
+    directory = settings.PROFILING_DIR
+    captures = sorted(os.listdir(directory), reverse=True) if os.path.isdir(directory) else []
+    return render(request, 'profiling/summary.html', {
+        'rows': rows,
+        'captures': captures,
+        'profiling_dir': directory,
+    })
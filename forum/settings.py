@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'forum.staticfiles.StaticFilesMiddleware',
+    'forum.profiling.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -55,7 +57,7 @@ ROOT_URLCONF = 'forum.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [os.path.join(BASE_DIR, 'forum', 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -82,6 +84,86 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/dev/topics/cache/
+# The local-memory cache is per process; point this at memcached/redis when
+# running more than one worker so session and user invalidation is shared.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/dev/topics/http/sessions/
+# FORUM_SESSION_BACKEND picks where session data lives:
+#   db             - django_session table (read on every request)
+#   cached_db      - cache first, database as write-through fallback
+#   cache          - cache only; sessions are lost when the cache is flushed
+#   signed_cookies - stored client-side in a signed cookie, no server storage
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('FORUM_SESSION_BACKEND', 'db')]
+
+
+# Authentication
+# https://docs.djangoproject.com/en/dev/topics/auth/customizing/
+# CachedModelBackend serves the per-request user lookup from the cache.
+# ModelBackend stays listed so sessions created before the switch stay valid.
+
+AUTHENTICATION_BACKENDS = [
+    'blog.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+USER_CACHE_TIMEOUT = 300
+
+# The user cache must be shared by every worker (see CachedModelBackend);
+# the local-memory cache above is only accepted for the single-process
+# development server.
+USER_CACHE_ALLOW_LOCAL = DEBUG
+
+
+# Feeds
+# Stored artifact the RSS/Atom/JSON feeds are served from (see blog.feeds).
+# It holds the newest FEED_MAX_ENTRIES posts; paged feeds end there, and
+# every post edit rewrites the whole file.
+
+FEED_ARTIFACT = os.path.join(BASE_DIR, 'feeds', 'posts.json')
+FEED_MAX_ENTRIES = 1000
+FEED_PAGE_SIZE = 50
+
+
+# View counters
+# Views are buffered in process and flushed to PostStats in batches (see
+# blog.counters); the popular posts sidebar is ranked with a 7 day half-life.
+
+VIEW_COUNT_FLUSH_INTERVAL = 10
+POPULAR_POSTS_COUNT = 5
+POPULAR_POSTS_HALF_LIFE = 7 * 24 * 3600
+
+
+# Profiling
+# Set FORUM_PROFILING=1 to enable forum.profiling.ProfilingMiddleware:
+# Server-Timing headers, N+1 warnings, sampled cProfile captures of slow
+# requests and a staff-only summary at /_profiling/.
+
+PROFILING_ENABLED = os.environ.get('FORUM_PROFILING') == '1'
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_SLOW_MS = 500
+PROFILING_DUPLICATE_THRESHOLD = 3
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_MAX_FILES = 50
+
+
 # Password validation
 # https://docs.djangoproject.com/en/dev/ref/settings/#auth-password-validators
 
@@ -120,3 +202,7 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+
+# Fingerprinted names plus .gz/.br variants are written by collectstatic and
+# served by forum.staticfiles.StaticFilesMiddleware.
+STATICFILES_STORAGE = 'forum.staticfiles.CompressedManifestStaticFilesStorage'
@@ -0,0 +1,157 @@
+"""
+Static asset pipeline for the forum project.
+
+``CompressedManifestStaticFilesStorage`` fingerprints files at collectstatic
+time and writes ``.gz`` (and ``.br`` when the ``brotli`` package is
+installed) siblings next to every compressible file.
+
+``StaticFilesMiddleware`` serves the collected files from STATIC_ROOT in
+process, choosing the best precompressed variant for the client and marking
+fingerprinted files as immutable.
+"""
+
+import gzip
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.eot', '.ttf', '.txt', '.html', '.json', '.xml', '.map')
+MIN_COMPRESS_SIZE = 256
+
+# Fingerprinted names change whenever their content does.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+
+def compress_file(path):
+    """Write .gz/.br siblings of ``path`` when they are actually smaller."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return
+
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts; ``gzip;q=0`` is a refusal, and ``*`` covers unlisted ones."""
+    qualities = {}
+    for token in header.split(','):
+        coding, _, params = token.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    accepted = {coding for coding, quality in qualities.items() if quality > 0}
+    if qualities.get('*', 0) > 0:
+        accepted.update(coding for coding, _ in StaticFilesMiddleware.encodings if coding not in qualities)
+    return accepted
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected yet (development server, tests): use the plain name.
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        for name in paths:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            for stored in {name, self.stored_name(name)}:
+                if self.exists(stored):
+                    compress_file(self.path(stored))
+
+
+class StaticFilesMiddleware:
+    """Serve collected static files with precompressed variants and far-future caching."""
+
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.root = settings.STATIC_ROOT
+        self._files = None
+        self._immutable = None
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def load(self):
+        """Index STATIC_ROOT once so requests never hit the filesystem to look up a file."""
+        files = {}
+        if self.root and os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                    files[name] = path
+
+        hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+        self._immutable = {hashed for name, hashed in hashed_files.items() if hashed != name}
+        self._files = files
+
+    def serve(self, request, name):
+        if self._files is None:
+            self.load()
+        path = self._files.get(name)
+        if path is None:
+            return None
+
+        stat = os.stat(path)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime, stat.st_size):
+            return HttpResponseNotModified()
+
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding = None
+        for candidate, suffix in self.encodings:
+            if candidate in accepted and name + suffix in self._files:
+                encoding, path = candidate, self._files[name + suffix]
+                break
+
+        content_type, _ = mimetypes.guess_type(name)
+        response = FileResponse(open(path, 'rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if name in self._immutable else DEFAULT_CACHE_CONTROL
+        return response
@@ -15,9 +15,11 @@ Including another URLconf
 """
 from django.conf.urls import url, include
 from django.contrib import admin
+from forum import profiling
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
+    url(r'^_profiling/$', profiling.summary, name='profiling_summary'),
     url(r'', include('blog.urls')),
 
 ]
@@ -1,11 +1,15 @@
+import time
+_START = time.perf_counter()
+
 import sys
 import json
+import importlib
+import sqlite3
 import traceback
-import requests
 
-from cloudevents.http import from_json
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
+# requests, cloudevents and azure.* are imported where they are first used
+# (through deferred_import) so the interpreter is ready, and a worker can start
+# polling, before paying for them.
 
 # ---------------------------
 # CONFIGURATION
@@ -16,10 +20,70 @@ SERVICENOW_PASSWORD = "your_password"
 SERVICENOW_API_PATH = "/api/now/table/cmdb_ci"
 SERVICENOW_QUERY_TEMPLATE = "?sysparm_query=ci_identifier={ci_value}&sysparm_limit=1"
 DEFAULT_API_VERSION = "2022-09-01"  # Use a generic API version
+
+# Worker mode
+QUEUE_PATH = "tag_events.db"
+BATCH_SIZE = 50          # max events per micro-batch
+BATCH_WAIT = 2.0         # seconds to wait for a batch to fill once the first event arrived
+POLL_INTERVAL = 1.0      # seconds between polls of an empty queue
+MAX_ATTEMPTS = 3         # an event is dropped after failing this many times
+CLAIM_TIMEOUT = 300      # seconds before a claimed but unfinished event (crashed worker) is handed out again
 # ---------------------------
 
+# Warm clients, reused across events (and batches in worker mode)
+_credential = None
+_resource_clients = {}
+_http_session = None
+
+_import_seconds = 0.0
+_first_event_reported = False
+
+def deferred_import(name):
+    """Import a module on first use, adding the time spent to _import_seconds."""
+    global _import_seconds
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_seconds += time.perf_counter() - started
+    return module
+
+def report_first_event(mode, idle=0.0):
+    """Print the time from interpreter start to the first processed event, once.
+
+    idle is time spent waiting for work (an empty queue), which is not startup.
+    """
+    global _first_event_reported
+    if not _first_event_reported:
+        _first_event_reported = True
+        elapsed = time.perf_counter() - _START - idle
+        print(f"[{mode}] first event processed {elapsed * 1000:.1f} ms after start, "
+              f"{_import_seconds * 1000:.1f} ms of it deferred imports")
+
+def get_resource_client(subscription_id):
+    """Return a cached ResourceManagementClient for the subscription."""
+    global _credential
+    if subscription_id not in _resource_clients:
+        if _credential is None:
+            _credential = deferred_import("azure.identity").DefaultAzureCredential()
+        client_class = deferred_import("azure.mgmt.resource").ResourceManagementClient
+        _resource_clients[subscription_id] = client_class(_credential, subscription_id)
+    return _resource_clients[subscription_id]
+
+def get_http_session():
+    """Return a shared requests session so ServiceNow connections are kept alive."""
+    global _http_session
+    if _http_session is None:
+        _http_session = deferred_import("requests").Session()
+        _http_session.auth = (SERVICENOW_USERNAME, SERVICENOW_PASSWORD)
+        _http_session.headers["Accept"] = "application/json"
+    return _http_session
+
+def parse_event(body):
+    """Parse a single queued CloudEvent."""
+    return deferred_import("cloudevents.http").from_json(body)
+
 def parse_cloudevents(raw_json):
     """Parse CloudEvents from Event Grid."""
+    from_json = deferred_import("cloudevents.http").from_json
     events = json.loads(raw_json)
     return [from_json(json.dumps(evt)) for evt in events]
 
@@ -28,27 +92,22 @@ def get_resource_id(cloud_event):
     data = cloud_event.data
     return data.get("resourceUri") or cloud_event["subject"]
 
-def get_resource_tags(resource_id):
-    """Get the current tags on the Azure resource."""
+def get_resource(resource_id):
+    """Get the Azure resource (its tags and location are needed for the update)."""
     subscription_id = resource_id.split("/")[2]
-    credential = DefaultAzureCredential()
-    client = ResourceManagementClient(credential, subscription_id)
+    client = get_resource_client(subscription_id)
 
     print("Fetching resource:", resource_id)
 
     resource = client.resources.get_by_id(resource_id, DEFAULT_API_VERSION)
-    return client, resource.tags or {}
+    return client, resource
 
 def get_ci_metadata(ci_value):
     """Fetch CI metadata from ServiceNow."""
     url = f"https://{SERVICENOW_INSTANCE}{SERVICENOW_API_PATH}{SERVICENOW_QUERY_TEMPLATE.format(ci_value=ci_value)}"
     print("Querying ServiceNow:", url)
 
-    response = requests.get(
-        url,
-        auth=(SERVICENOW_USERNAME, SERVICENOW_PASSWORD),
-        headers={"Accept": "application/json"}
-    )
+    response = get_http_session().get(url)
 
     if response.status_code != 200:
         raise Exception(f"ServiceNow API error: {response.status_code} {response.text}")
@@ -79,10 +138,15 @@ def update_resource_tags(client, resource_id, updated_tags, resource):
     ).result()
     print("Update result:", result.as_dict())
     
-def process_event(event):
-    """Main logic for a single event."""
+def process_event(event, ci_cache=None):
+    """Main logic for a single event.
+
+    ci_cache maps CI values to ServiceNow metadata already fetched in the
+    same batch, so a burst of events for one application costs one lookup.
+    """
     resource_id = get_resource_id(event)
-    client, tags = get_resource_tags(resource_id)
+    client, resource = get_resource(resource_id)
+    tags = resource.tags or {}
 
     ci_value = tags.get("syf:application:ci")
     if not ci_value:
@@ -90,24 +154,178 @@ def process_event(event):
         return
 
     print("CI tag found:", ci_value)
-    ci_metadata = get_ci_metadata(ci_value)
+    if ci_cache is None:
+        ci_cache = {}
+    if ci_value not in ci_cache:
+        ci_cache[ci_value] = get_ci_metadata(ci_value)
+    ci_metadata = ci_cache[ci_value]
 
     # Merge new tags
     new_tags = {**tags, **ci_metadata}
-    update_resource_tags(client, resource_id, new_tags)
+    if new_tags == tags:
+        print(f"Tags already up to date on {resource_id}.")
+        return
+    update_resource_tags(client, resource_id, new_tags, resource)
 
-def main():
+def report_throughput(mode, count, elapsed):
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"[{mode}] processed {count} event(s) in {elapsed:.3f}s ({rate:.1f} events/sec)")
+
+# ---------------------------
+# QUEUE (local SQLite stand-in for a Storage/Service Bus queue)
+# ---------------------------
+
+def open_queue(path=QUEUE_PATH):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS events ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " body TEXT NOT NULL,"
+        " attempts INTEGER NOT NULL DEFAULT 0,"
+        " claimed_at REAL)"
+    )
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(events)")]
+    if "claimed_at" not in columns:  # queue created by an older version
+        conn.execute("ALTER TABLE events ADD COLUMN claimed_at REAL")
+    return conn
+
+def enqueue(conn, raw_json):
+    """Queue every CloudEvent in an Event Grid delivery (a JSON array)."""
+    events = json.loads(raw_json)
+    conn.executemany("INSERT INTO events (body) VALUES (?)", [(json.dumps(evt),) for evt in events])
+    return len(events)
+
+def claim_batch(conn, batch_size):
+    """Mark up to batch_size available events as in flight and return them.
+
+    BEGIN IMMEDIATE takes the write lock before reading, so two workers on
+    the same queue never claim the same event.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            "SELECT id, body, attempts FROM events"
+            " WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY id LIMIT ?",
+            (now - CLAIM_TIMEOUT, batch_size),
+        ).fetchall()
+        conn.executemany("UPDATE events SET claimed_at = ? WHERE id = ?", [(now, row[0]) for row in rows])
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+def fetch_batch(conn, batch_size=None, batch_wait=None, poll_interval=None):
+    """Block until at least one event is available, wait up to batch_wait for the batch to fill, then claim it."""
+    batch_size = batch_size or BATCH_SIZE
+    batch_wait = BATCH_WAIT if batch_wait is None else batch_wait
+    poll_interval = poll_interval or POLL_INTERVAL
+    deadline = None
+    while True:
+        available = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM events"
+            " WHERE claimed_at IS NULL OR claimed_at < ? LIMIT ?)",
+            (time.time() - CLAIM_TIMEOUT, batch_size),
+        ).fetchone()[0]
+        if available and deadline is None:
+            deadline = time.monotonic() + batch_wait
+        if available >= batch_size or (available and time.monotonic() >= deadline):
+            rows = claim_batch(conn, batch_size)
+            if rows:
+                return rows
+            deadline = None  # another worker claimed them first
+        time.sleep(min(poll_interval, batch_wait) if available else poll_interval)
+
+def process_batch(conn, rows, idle=0.0):
+    """Process one micro-batch; failed events are released for a retry, up to MAX_ATTEMPTS."""
+    ci_cache = {}
+    done, retry = [], []
+    for row_id, body, attempts in rows:
+        print(f"\n--- Processing Event {row_id} ---")
+        try:
+            process_event(parse_event(body), ci_cache)
+            done.append(row_id)
+            report_first_event("worker", idle)
+        except Exception as e:
+            print(f"Event {row_id} failed (attempt {attempts + 1}):", str(e))
+            traceback.print_exc()
+            if attempts + 1 >= MAX_ATTEMPTS:
+                done.append(row_id)
+            else:
+                retry.append(row_id)
+
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in done])
+    conn.executemany(
+        "UPDATE events SET attempts = attempts + 1, claimed_at = NULL WHERE id = ?", [(i,) for i in retry]
+    )
+    conn.execute("COMMIT")
+    return len(rows)
+
+def run_worker(queue_path=QUEUE_PATH, max_batches=None):
+    """Long-running consumer: micro-batch queued events and keep clients warm between batches."""
+    conn = open_queue(queue_path)
+    print(f"[worker] polling {queue_path} {(time.perf_counter() - _START) * 1000:.1f} ms after start")
+
+    total, started, batches = 0, None, 0
+    while max_batches is None or batches < max_batches:
+        wait_start = time.perf_counter()
+        rows = fetch_batch(conn)
+        if started is None:
+            started = time.perf_counter()
+            idle = started - wait_start
+        batch_start, imports_before = time.perf_counter(), _import_seconds
+        count = process_batch(conn, rows, idle)
+        total += count
+        batches += 1
+        # Imports happen on first use inside a batch; they are reported with
+        # the first event and kept out of the events/sec figures.
+        batch_imports = _import_seconds - imports_before
+        report_throughput("batch", count, time.perf_counter() - batch_start - batch_imports)
+        report_throughput("worker", total, time.perf_counter() - started - _import_seconds)
+    conn.close()
+
+def run_once(raw_input):
+    """One-shot runbook mode: process a single Event Grid delivery."""
     try:
-        raw_input = sys.argv[1]
         print("Received input (truncated):", raw_input[:300])
+        print(f"[one-shot] startup {(time.perf_counter() - _START) * 1000:.1f} ms")
 
+        started = time.perf_counter()
         events = parse_cloudevents(raw_input)
+        ci_cache = {}
         for event in events:
             print("\n--- Processing Event ---")
-            process_event(event)
+            process_event(event, ci_cache)
+            report_first_event("one-shot")
+        report_throughput("one-shot", len(events), time.perf_counter() - started)
 
     except Exception as e:
         print("Runbook failed:", str(e))
         traceback.print_exc()
 
-main()
+def main():
+    """
+    Usage:
+        tag.py '<event grid json>'              one-shot runbook (default)
+        tag.py --enqueue '<event grid json>'    add a delivery to the local queue
+        tag.py --worker                         consume the local queue until stopped
+
+    Several workers may share one queue; each event is claimed by one of them.
+    """
+    args = sys.argv[1:]
+    if not args or (args[0] == "--enqueue" and len(args) < 2):
+        print(main.__doc__)
+    elif args[0] == "--worker":
+        run_worker()
+    elif args[0] == "--enqueue":
+        conn = open_queue()
+        print(f"Queued {enqueue(conn, args[1])} event(s).")
+        conn.close()
+    else:
+        run_once(args[0])
+
+if __name__ == "__main__":
+    main()
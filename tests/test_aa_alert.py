@@ -0,0 +1,158 @@
+"""Tests for Aa-alert.py with a fake Resource Graph client and a fake EmailClient."""
+
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Aa-alert.py')
+
+
+class Model:
+    """Stands in for the SDK request/message models, which only hold attributes."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def load_script():
+    fake_sdk = {}
+    for name in ('azure', 'azure.identity', 'azure.mgmt', 'azure.mgmt.resource',
+                 'azure.mgmt.resourcegraph', 'azure.mgmt.resourcegraph.models',
+                 'azure.communication', 'azure.communication.email'):
+        module = types.ModuleType(name)
+        for attr in ('AzureCliCredential', 'SubscriptionClient', 'ResourceGraphClient',
+                     'QueryRequest', 'QueryRequestOptions', 'EmailClient', 'EmailContent',
+                     'EmailMessage', 'EmailRecipients', 'EmailAddress'):
+            setattr(module, attr, Model)
+        fake_sdk[name] = module
+
+    with mock.patch.dict(sys.modules, fake_sdk):
+        spec = importlib.util.spec_from_file_location('aa_alert', SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+aa_alert = load_script()
+
+
+class FakeGraphClient:
+    """Serves the given pages in order, chaining them with skip tokens."""
+
+    def __init__(self, *pages):
+        self.pages = pages
+        self.requests = []
+
+    def resources(self, request):
+        self.requests.append(request)
+        index = int(request.options.skip_token or 0)
+        next_token = str(index + 1) if index + 1 < len(self.pages) else None
+        return Model(data=self.pages[index], skip_token=next_token)
+
+
+class FakeEmailClient:
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    def begin_send(self, message):
+        if self.fail:
+            raise RuntimeError("send failed")
+        self.sent.append(message)
+        return Model(result=lambda: {'messageId': 'message-%d' % len(self.sent)})
+
+
+def row(name, created, resource_type='Microsoft.Automation/automationAccounts'):
+    return {
+        'id': '/subscriptions/sub/resourceGroups/rg/providers/%s/%s' % (resource_type, name),
+        'name': name,
+        'type': resource_type.lower(),
+        'resourceGroup': 'rg',
+        'subscriptionId': 'sub',
+        'creationTime': created,
+    }
+
+
+class RunWatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.state_dir)
+        self.state_path = os.path.join(self.state_dir, 'state.json')
+        self.now = datetime(2026, 3, 1, 12, tzinfo=timezone.utc)
+        stdout = mock.patch('sys.stdout')
+        stdout.start()
+        self.addCleanup(stdout.stop)
+
+    def run_watch(self, graph, email, now=None):
+        return aa_alert.run_watch(graph, ['sub'], email_client=email,
+                                  state_path=self.state_path, now=now or self.now)
+
+    def read_state(self):
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def test_follows_skip_token_across_pages(self):
+        graph = FakeGraphClient([row('a', '2026-03-01T01:00:00Z')],
+                                [row('b', '2026-03-01T02:00:00Z')],
+                                [row('c', '2026-03-01T03:00:00Z')])
+        findings = self.run_watch(graph, FakeEmailClient())
+        self.assertEqual([item['name'] for item in findings], ['a', 'b', 'c'])
+        self.assertEqual([r.options.skip_token for r in graph.requests], [None, '1', '2'])
+
+    def test_rerun_skips_already_reported_ids(self):
+        email = FakeEmailClient()
+        self.run_watch(FakeGraphClient([row('a', '2026-03-01T11:30:00Z')]), email)
+
+        later = self.now + timedelta(minutes=30)
+        # 'a' is back because it is inside the overlap window.
+        graph = FakeGraphClient([row('a', '2026-03-01T11:30:00Z'), row('b', '2026-03-01T12:10:00Z')])
+        findings = self.run_watch(graph, email, now=later)
+        self.assertEqual([item['name'] for item in findings], ['b'])
+        self.assertEqual(len(email.sent), 2)
+
+    def test_watermark_is_persisted_and_advances_on_quiet_runs(self):
+        self.run_watch(FakeGraphClient([]), FakeEmailClient())
+        self.assertEqual(self.read_state()['watermark'], self.now.isoformat())
+
+        later = self.now + timedelta(hours=6)
+        graph = FakeGraphClient([])
+        self.run_watch(graph, FakeEmailClient(), now=later)
+        since = (self.now - aa_alert.WATERMARK_OVERLAP).isoformat()
+        self.assertIn('datetime(%s)' % since, graph.requests[0].query)
+        self.assertEqual(self.read_state()['watermark'], later.isoformat())
+
+    def test_many_resource_types_go_out_in_one_digest(self):
+        resource_types = ['Microsoft.Automation/automationAccounts', 'Microsoft.Storage/storageAccounts']
+        graph = FakeGraphClient([row('auto', '2026-03-01T01:00:00Z', resource_types[0]),
+                                 row('store', '2026-03-01T02:00:00Z', resource_types[1])])
+        email = FakeEmailClient()
+        aa_alert.run_watch(graph, ['sub'], resource_types=resource_types, email_client=email,
+                           state_path=self.state_path, now=self.now)
+
+        self.assertEqual(len(email.sent), 1)
+        body = email.sent[0].content.plain_text
+        self.assertIn('microsoft.automation/automationaccounts (1)', body)
+        self.assertIn('microsoft.storage/storageaccounts (1)', body)
+        self.assertIn('"microsoft.storage/storageaccounts"', graph.requests[0].query)
+
+    def test_state_is_not_saved_when_send_fails(self):
+        graph = FakeGraphClient([row('a', '2026-03-01T01:00:00Z')])
+        with self.assertRaises(RuntimeError):
+            self.run_watch(graph, FakeEmailClient(fail=True))
+        self.assertFalse(os.path.exists(self.state_path))
+
+        findings = self.run_watch(FakeGraphClient([row('a', '2026-03-01T01:00:00Z')]), FakeEmailClient())
+        self.assertEqual([item['name'] for item in findings], ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""Tests for the queue-consumer worker mode of tag.py, using the SQLite queue."""
+
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tag.py')
+
+spec = importlib.util.spec_from_file_location('tag', SCRIPT)
+tag = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tag)
+
+
+class FakeEvent:
+
+    def __init__(self, body):
+        self.event = json.loads(body)
+        self.data = self.event.get('data', {})
+
+    def __getitem__(self, key):
+        return self.event[key]
+
+
+def events(count, subscription='sub'):
+    return json.dumps([
+        {'id': str(i), 'subject': '/subscriptions/%s/resourceGroups/rg/providers/x/y/r%d' % (subscription, i), 'data': {}}
+        for i in range(count)
+    ])
+
+
+class WorkerTests(unittest.TestCase):
+
+    def setUp(self):
+        queue_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, queue_dir)
+        self.queue_path = os.path.join(queue_dir, 'queue.db')
+        self.conn = tag.open_queue(self.queue_path)
+        self.addCleanup(self.conn.close)
+
+        for patcher in (mock.patch('sys.stdout'),
+                        mock.patch('traceback.print_exc'),
+                        mock.patch.object(tag, 'parse_event', FakeEvent),
+                        mock.patch.object(tag, 'BATCH_WAIT', 0.01),
+                        mock.patch.object(tag, 'POLL_INTERVAL', 0.01)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def queued(self):
+        return self.conn.execute("SELECT id, attempts FROM events ORDER BY id").fetchall()
+
+    def test_batch_is_returned_as_soon_as_it_is_full(self):
+        tag.enqueue(self.conn, events(5))
+        started = time.monotonic()
+        rows = tag.fetch_batch(self.conn, batch_size=2, batch_wait=10, poll_interval=0.01)
+        self.assertEqual(len(rows), 2)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_partial_batch_is_returned_after_the_wait(self):
+        tag.enqueue(self.conn, events(1))
+        started = time.monotonic()
+        rows = tag.fetch_batch(self.conn, batch_size=10, batch_wait=0.05, poll_interval=0.01)
+        self.assertEqual(len(rows), 1)
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+    def test_workers_sharing_a_queue_claim_different_events(self):
+        tag.enqueue(self.conn, events(3))
+        other = tag.open_queue(self.queue_path)
+        self.addCleanup(other.close)
+
+        first = tag.fetch_batch(self.conn, batch_size=2, batch_wait=0)
+        second = tag.fetch_batch(other, batch_size=2, batch_wait=0)
+        self.assertEqual([row[0] for row in first], [1, 2])
+        self.assertEqual([row[0] for row in second], [3])
+
+    def test_abandoned_claims_are_handed_out_again(self):
+        tag.enqueue(self.conn, events(1))
+        tag.fetch_batch(self.conn, batch_wait=0)
+        self.assertEqual(tag.claim_batch(self.conn, 10), [])
+        with mock.patch.object(tag, 'CLAIM_TIMEOUT', 0):
+            self.assertEqual(len(tag.claim_batch(self.conn, 10)), 1)
+
+    def test_failed_event_is_retried_then_dropped(self):
+        tag.enqueue(self.conn, events(1))
+        with mock.patch.object(tag, 'MAX_ATTEMPTS', 3), \
+                mock.patch.object(tag, 'process_event', side_effect=RuntimeError("boom")) as process_event:
+            for attempts in (1, 2):
+                tag.process_batch(self.conn, tag.fetch_batch(self.conn, batch_wait=0))
+                self.assertEqual([row[1] for row in self.queued()], [attempts])
+            tag.process_batch(self.conn, tag.fetch_batch(self.conn, batch_wait=0))
+        self.assertEqual(self.queued(), [])
+        self.assertEqual(process_event.call_count, 3)
+
+    def test_successful_events_are_deleted(self):
+        tag.enqueue(self.conn, events(3))
+        with mock.patch.object(tag, 'process_event') as process_event:
+            tag.run_worker(self.queue_path, max_batches=1)
+        self.assertEqual(process_event.call_count, 3)
+        self.assertEqual(self.queued(), [])
+
+    def test_clients_are_reused_across_batches(self):
+        created = {'credential': 0, 'client': 0}
+
+        def credential():
+            created['credential'] += 1
+            return object()
+
+        def client(credential, subscription_id):
+            created['client'] += 1
+            resource = types.SimpleNamespace(tags={}, location='westeurope')
+            return types.SimpleNamespace(resources=types.SimpleNamespace(get_by_id=lambda *args: resource))
+
+        fake_sdk = {
+            'azure': types.ModuleType('azure'),
+            'azure.identity': types.SimpleNamespace(DefaultAzureCredential=credential),
+            'azure.mgmt': types.ModuleType('azure.mgmt'),
+            'azure.mgmt.resource': types.SimpleNamespace(ResourceManagementClient=client),
+        }
+        tag.enqueue(self.conn, events(4))
+        with mock.patch.dict(sys.modules, fake_sdk), \
+                mock.patch.object(tag, '_credential', None), \
+                mock.patch.object(tag, '_resource_clients', {}), \
+                mock.patch.object(tag, 'BATCH_SIZE', 2):
+            tag.run_worker(self.queue_path, max_batches=2)
+
+        self.assertEqual(self.queued(), [])
+        self.assertEqual(created, {'credential': 1, 'client': 1})
+
+
+class MainTests(unittest.TestCase):
+
+    def test_one_shot_imports_modules_on_first_use_only(self):
+        imported = []
+
+        def deferred_import(name):
+            imported.append(name)
+            return types.SimpleNamespace(from_json=FakeEvent)
+
+        with mock.patch.object(tag, 'deferred_import', deferred_import), \
+                mock.patch.object(tag, 'process_event'), \
+                mock.patch('sys.stdout'):
+            tag.run_once(events(2))
+        self.assertEqual(imported, ['cloudevents.http'])
+
+    def test_missing_arguments_print_usage(self):
+        for argv in (['tag.py'], ['tag.py', '--enqueue']):
+            with mock.patch('sys.argv', argv), mock.patch('builtins.print') as print_:
+                tag.main()
+            print_.assert_called_once_with(tag.main.__doc__)
+
+
+if __name__ == '__main__':
+    unittest.main()